@@ -5,19 +5,27 @@ Esta página contiene la funcionalidad principal de la aplicación original:
 permitir al reclutador definir los requisitos de un puesto y obtener un
 ranking de los mejores candidatos basado en un análisis RAG.
 """
-from typing import List, Dict, Any, Optional
+import re
+from typing import List, Dict, Any, Optional, Tuple
 from operator import itemgetter
 
+import pandas as pd
 import streamlit as st
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
-from langchain_core.runnables import Runnable
+from langchain_core.runnables import Runnable, RunnableLambda
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.vectorstores import VectorStoreRetriever
 
-from src.vector_store import get_db_stats
-from src.rag_pipeline import load_llm_and_retriever, format_docs
+from src.vector_store import get_db_stats, get_db_version, find_sources_with_keywords
+from src.rag_pipeline import (
+    load_llm_and_retriever,
+    build_context_chain,
+    get_filtered_retriever,
+    merge_docs
+)
 from src.config import RANKING_PROMPT_TEMPLATE, TOP_K_CANDIDATES
+from src.schemas import Candidate, AFFINITY_SCORE, CANDIDATE_LIST
 
 st.set_page_config(
     page_title="Ranking de Candidatos",
@@ -25,6 +33,19 @@ st.set_page_config(
     layout="wide"
 )
 
+# Objetos inmutables de LangChain: se construyen una sola vez por proceso
+PROMPT = ChatPromptTemplate.from_template(RANKING_PROMPT_TEMPLATE)
+# La respuesta JSON se valida contra el esquema `Candidate` en el propio parser
+PARSER = JsonOutputParser() | RunnableLambda(CANDIDATE_LIST.validate_python)
+
+# Palabras del título del puesto que no sirven para filtrar CVs: conectores y
+# niveles de seniority, que aparecen en casi cualquier CV
+TITLE_STOPWORDS = {
+    "para", "como", "with", "from", "sobre",
+    "senior", "junior", "semi", "semisenior", "trainee", "intern", "becario",
+    "practicante", "lead", "líder", "lider", "head", "jefe", "principal", "staff",
+}
+
 # --- Funciones de Lógica de la Aplicación ---
 
 def build_query(
@@ -40,24 +61,94 @@ def build_query(
         query_parts.append(f"Otros requisitos importantes: {reqs}")
     return " ".join(query_parts)
 
+def build_sub_queries(job_title: str, skills: str, reqs: str) -> Tuple[str, ...]:
+    """Divide la búsqueda en consultas más específicas para el retriever.
+
+    Cada filtro de la UI (puesto, habilidades y requisitos) se busca por
+    separado para que ninguno quede eclipsado por los demás en la similitud.
+    """
+    sub_queries: List[str] = [f"Puesto: {job_title}"]
+    if skills:
+        sub_queries.append(f"Habilidades: {skills}")
+    if reqs:
+        sub_queries.append(f"Requisitos: {reqs}")
+    return tuple(sub_queries)
+
+def extract_title_keywords(job_title: str) -> Tuple[str, ...]:
+    """Extrae las palabras significativas del título del puesto para el pre-filtrado."""
+    words = re.findall(r"\w+", job_title)
+    return tuple(sorted({
+        word for word in words
+        if len(word) >= 4 and word.lower() not in TITLE_STOPWORDS
+    }))
+
+# Una entrada por cada resultado distinto del pre-filtrado: se acota para no acumularlas
+@st.cache_resource(max_entries=32)
 def get_rag_chain(
-    retriever: VectorStoreRetriever, llm: ChatGoogleGenerativeAI
+    _llm: ChatGoogleGenerativeAI, sources: Tuple[str, ...] = ()
 ) -> Runnable:
-    """Crea y devuelve la cadena de RAG (LangChain) completa."""
-    prompt = ChatPromptTemplate.from_template(RANKING_PROMPT_TEMPLATE)
-    parser = JsonOutputParser()
+    """Crea y cachea la cadena de RAG (LangChain) completa.
+
+    Args:
+        _llm: El LLM singleton de `load_llm_and_retriever` (no forma parte de la
+            clave de caché).
+        sources: CVs a los que se restringe la búsqueda. Si está vacío, se
+            consulta la base de datos completa.
+    """
+    retriever = get_filtered_retriever(sources)
+
+    # Las subconsultas se recuperan en paralelo (`map`) y se fusionan sin duplicados
+    docs_retriever = itemgetter("sub_queries") | retriever.map() | merge_docs
+
     # Se usa () para romper la línea de la cadena de forma legible
     return (
         {
-            "context": itemgetter("question") | retriever | format_docs,
+            "context": build_context_chain(docs_retriever),
             "question": itemgetter("question"),
         }
-        | prompt
-        | llm
-        | parser
+        | PROMPT
+        | _llm
+        | PARSER
     )
 
-def process_and_display_results(query: str, response: List[Dict[str, Any]]) -> None:
+def normalize_text(text: str) -> str:
+    """Normaliza un texto (minúsculas y espacios colapsados) para usarlo como clave de caché."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def cached_invoke(
+    _query: str,
+    normalized_query: str,
+    sub_queries: Tuple[str, ...],
+    title_keywords: Tuple[str, ...],
+    db_version: int
+) -> List[Candidate]:
+    """Ejecuta la cadena de RAG y cachea la respuesta del LLM.
+
+    Antes de consultar al LLM, la búsqueda se restringe a los CVs que mencionan
+    alguna palabra del título del puesto. Si ninguno la menciona, o la mencionan
+    la mayoría, se consulta la base de datos completa
+    (ver `find_sources_with_keywords`).
+
+    Args:
+        _query: La consulta original que se envía al LLM (no forma parte de la
+            clave de caché).
+        normalized_query: La misma consulta normalizada con `normalize_text`;
+            es la que identifica la respuesta en la caché.
+        sub_queries: Consultas específicas para el retriever, construidas a
+            partir de los filtros normalizados (`build_sub_queries`).
+        title_keywords: Palabras clave del título normalizado del puesto.
+        db_version: Versión de la DB (`get_db_version`); cambia con cada carga
+            o reinicio para invalidar las respuestas obsoletas.
+    """
+    llm, _ = load_llm_and_retriever()
+    sources = find_sources_with_keywords(title_keywords)
+    rag_chain = get_rag_chain(llm, tuple(sources))
+    # `invoke` síncrono: las subconsultas ya se recuperan en paralelo con `map`,
+    # y un `asyncio.run` por llamada dejaría al cliente del LLM ligado a un bucle cerrado
+    return rag_chain.invoke({"question": _query, "sub_queries": list(sub_queries)})
+
+def process_and_display_results(query: str, response: List[Candidate]) -> None:
     """Procesa la respuesta del LLM, la ordena y la muestra en la UI."""
     st.markdown("#### 📝 Resumen de tu Búsqueda:")
     st.info(query)
@@ -67,13 +158,9 @@ def process_and_display_results(query: str, response: List[Dict[str, Any]]) -> N
         st.warning("No se encontraron candidatos que cumplan los requisitos.")
         return
 
-    affinity_map = {"Alta": 3, "Media": 2, "Baja": 1, "N/A": 0}
-    
-    filtered = [cand for cand in response if cand.get("is_job_title_match")]
+    filtered = [cand for cand in response if cand.is_job_title_match]
     sorted_candidates = sorted(
-        filtered,
-        key=lambda x: affinity_map.get(x.get("affinity", "N/A"), 0),
-        reverse=True
+        filtered, key=lambda cand: AFFINITY_SCORE[cand.affinity], reverse=True
     )
     top_k = sorted_candidates[:TOP_K_CANDIDATES]
 
@@ -82,19 +169,27 @@ def process_and_display_results(query: str, response: List[Dict[str, Any]]) -> N
         return
 
     st.markdown(f"#### 🏆 Top {len(top_k)} Candidatos Encontrados:")
-    for candidate in top_k:
-        expander_title = (
-            f"📄 **{candidate.get('file_name', 'N/A')}** - "
-            f"Afinidad: **{candidate.get('affinity', 'N/A')}**"
-        )
-        with st.expander(expander_title):
-            st.subheader(
-                f"Puesto Encontrado: {candidate.get('job_title_found', 'N/A')}"
-            )
-            st.markdown("**Resumen:**")
-            st.markdown(candidate.get('summary', 'Sin resumen.'))
-            st.markdown("**Análisis de Requisitos Clave:**")
-            st.markdown(candidate.get('key_requirements_analysis', 'Sin análisis.'))
+    results = pd.DataFrame(
+        [
+            candidate.model_dump(mode="json", exclude={"is_job_title_match"})
+            for candidate in top_k
+        ]
+    )
+    # Una sola tabla se envía al navegador en un único mensaje
+    st.dataframe(
+        results,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "file_name": st.column_config.TextColumn("📄 CV"),
+            "affinity": st.column_config.TextColumn("Afinidad", width="small"),
+            "job_title_found": st.column_config.TextColumn("Puesto Encontrado"),
+            "summary": st.column_config.TextColumn("Resumen", width="large"),
+            "key_requirements_analysis": st.column_config.TextColumn(
+                "Análisis de Requisitos Clave", width="large"
+            ),
+        }
+    )
 
 # --- Funciones de la Interfaz de Usuario (UI) ---
 
@@ -155,11 +250,22 @@ def render_main_content(
             return
 
         query = build_query(**{k: v for k, v in filters.items() if k != 'analyze'})
-        rag_chain = get_rag_chain(retriever, llm)
-        
+        # Las entradas de la caché dependen solo de los filtros normalizados, de
+        # modo que "Data  Scientist" y "data scientist" comparten la respuesta
+        job_title, skills, reqs = (
+            normalize_text(filters[key]) for key in ("job_title", "skills", "reqs")
+        )
+        db_version = get_db_version()
+
         with st.spinner(f"Analizando candidatos para '{filters['job_title']}'..." ):
             try:
-                response = rag_chain.invoke({"question": query})
+                response = cached_invoke(
+                    query,
+                    normalize_text(query),
+                    build_sub_queries(job_title, skills, reqs),
+                    extract_title_keywords(job_title),
+                    db_version
+                )
                 process_and_display_results(query, response)
             except Exception as e:
                 st.error(f"Ocurrió un error al procesar la respuesta de la IA: {e}")
@@ -5,7 +5,9 @@ Este módulo proporciona una interfaz de chat para que los usuarios puedan
 conversar directamente con la base de conocimiento de CVs, permitiendo
 preguntas abiertas y exploratorias.
 """
+import logging
 from operator import itemgetter
+from typing import List, Dict
 
 import streamlit as st
 from langchain.prompts import ChatPromptTemplate
@@ -14,8 +16,12 @@ from langchain_core.runnables import Runnable
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.vectorstores import VectorStoreRetriever
 
-from src.rag_pipeline import load_llm_and_retriever, format_docs
-from src.config import CHAT_PROMPT_TEMPLATE
+from src.rag_pipeline import load_llm_and_retriever, build_context_chain
+from src.config import (
+    CHAT_PROMPT_TEMPLATE,
+    CHAT_SUMMARY_PROMPT_TEMPLATE,
+    CHAT_HISTORY_MAX_TURNS
+)
 
 st.set_page_config(
     page_title="Chat con CVs",
@@ -30,23 +36,76 @@ st.markdown(
 
 # --- Lógica de la Cadena de Chat ---
 
+# Objetos inmutables de LangChain: se construyen una sola vez por proceso
+CHAT_PROMPT = ChatPromptTemplate.from_template(CHAT_PROMPT_TEMPLATE)
+SUMMARY_PROMPT = ChatPromptTemplate.from_template(CHAT_SUMMARY_PROMPT_TEMPLATE)
+PARSER = StrOutputParser()
+
+# Mensajes (usuario + asistente) de los últimos `CHAT_HISTORY_MAX_TURNS` turnos,
+# que siempre se envían literalmente al LLM
+HISTORY_KEEP_MESSAGES = 2 * CHAT_HISTORY_MAX_TURNS
+# Máximo de mensajes sin resumir: al superarlo se condensan los más antiguos
+HISTORY_WINDOW = 2 * HISTORY_KEEP_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+@st.cache_resource
 def get_chat_rag_chain(
-    retriever: VectorStoreRetriever, llm: ChatGoogleGenerativeAI
+    _retriever: VectorStoreRetriever, _llm: ChatGoogleGenerativeAI
 ) -> Runnable:
-    """Crea y devuelve la cadena de RAG específica para el chat conversacional."""
-    prompt = ChatPromptTemplate.from_template(CHAT_PROMPT_TEMPLATE)
-    parser = StrOutputParser()
-    
+    """Crea y cachea la cadena de RAG específica para el chat conversacional.
+
+    Los argumentos no se usan como clave de caché (prefijo `_`): son los
+    singletons de `load_llm_and_retriever` y se invalidan junto con ella.
+    """
     return (
         {
-            "context": itemgetter("question") | retriever | format_docs,
+            "context": build_context_chain(itemgetter("question") | _retriever),
             "question": itemgetter("question"),
+            "history_summary": itemgetter("history_summary"),
+            "chat_history": itemgetter("chat_history"),
         }
-        | prompt
-        | llm
-        | parser
+        | CHAT_PROMPT
+        | _llm
+        | PARSER
     )
 
+def format_messages(messages: List[Dict[str, str]]) -> str:
+    """Convierte mensajes del historial en texto plano para el prompt."""
+    if not messages:
+        return "Sin mensajes."
+    roles = {"user": "Reclutador", "assistant": "Asistente"}
+    return "\n".join(f"{roles[m['role']]}: {m['content']}" for m in messages)
+
+def history_messages() -> List[Dict[str, str]]:
+    """Devuelve el historial que se envía al LLM, sin los mensajes de error."""
+    return [m for m in st.session_state.messages if not m.get("error")]
+
+def needs_summary() -> bool:
+    """Indica si los mensajes sin resumir desbordan la ventana del historial."""
+    return len(history_messages()) - st.session_state.summarized_count > HISTORY_WINDOW
+
+def update_history_summary(llm: ChatGoogleGenerativeAI) -> None:
+    """Condensa en el resumen los mensajes más antiguos de la ventana.
+
+    Se conservan literalmente los mensajes de los últimos
+    `CHAT_HISTORY_MAX_TURNS` turnos, de modo que la siguiente llamada al LLM
+    solo se produce cuando la ventana vuelve a desbordarse y no en cada turno.
+    """
+    messages = history_messages()
+    summarized = st.session_state.summarized_count
+    new_messages = messages[summarized:len(messages) - HISTORY_KEEP_MESSAGES]
+    if not new_messages:
+        return
+
+    # Llamada directa al LLM: no hace falta componer una cadena LCEL por resumen
+    summary_messages = SUMMARY_PROMPT.format_messages(
+        history_summary=st.session_state.history_summary or "Sin resumen.",
+        new_messages=format_messages(new_messages),
+    )
+    st.session_state.history_summary = llm.invoke(summary_messages).content
+    st.session_state.summarized_count = summarized + len(new_messages)
+
 # --- Renderizado de la Interfaz ---
 
 llm, retriever = load_llm_and_retriever()
@@ -64,6 +123,8 @@ if not llm or not retriever:
 # Inicializar el historial del chat en el estado de la sesión
 if "messages" not in st.session_state:
     st.session_state.messages = []
+    st.session_state.history_summary = ""
+    st.session_state.summarized_count = 0
 
 # Mostrar mensajes previos del historial
 for message in st.session_state.messages:
@@ -72,22 +133,36 @@ for message in st.session_state.messages:
 
 # Aceptar la entrada del usuario
 if prompt := st.chat_input("¿Qué te gustaría saber de estos candidatos?"):
+    chat_inputs = {
+        "question": prompt,
+        "history_summary": st.session_state.history_summary or "Sin resumen.",
+        "chat_history": format_messages(
+            history_messages()[st.session_state.summarized_count:]
+        ),
+    }
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        with st.spinner("Pensando..."):
-            rag_chain = get_chat_rag_chain(retriever, llm)
-            try:
-                response = rag_chain.invoke({"question": prompt})
-                st.markdown(response)
-                st.session_state.messages.append(
-                    {"role": "assistant", "content": response}
-                )
-            except Exception as e:
-                error_message = f"Ocurrió un error al contactar a la IA: {e}"
-                st.error(error_message)
-                st.session_state.messages.append(
-                    {"role": "assistant", "content": error_message}
-                )
+        rag_chain = get_chat_rag_chain(retriever, llm)
+        try:
+            # La respuesta se muestra a medida que el LLM genera los tokens
+            response = st.write_stream(rag_chain.stream(chat_inputs))
+            st.session_state.messages.append(
+                {"role": "assistant", "content": response}
+            )
+        except Exception as e:
+            error_message = f"Ocurrió un error al contactar a la IA: {e}"
+            st.error(error_message)
+            st.session_state.messages.append(
+                {"role": "assistant", "content": error_message, "error": True}
+            )
+
+    # Solo se resume cuando la ventana se desborda; si falla, los mensajes
+    # pendientes se condensan en el siguiente turno
+    if needs_summary():
+        try:
+            update_history_summary(llm)
+        except Exception as e:
+            logger.warning("No se pudo actualizar el resumen del chat: %s", e)
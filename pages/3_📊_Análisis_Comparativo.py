@@ -5,16 +5,26 @@ Este módulo permite al usuario seleccionar a 2 o 3 candidatos y compararlos
 cabeza a cabeza según un criterio específico, generando una tabla en Markdown.
 """
 import streamlit as st
-from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage
 
-from src.rag_pipeline import load_llm_and_retriever, format_docs
-from src.vector_store import get_db_stats, get_chroma_client
-from src.config import RETRIEVER_K, COMPARISON_PROMPT_TEMPLATE, CHROMA_COLLECTION_NAME
-from src.models import load_embedding_model
+from src.rag_pipeline import (
+    load_llm_and_retriever,
+    get_llm,
+    get_vector_store,
+    merge_docs,
+    format_docs
+)
+from src.vector_store import get_db_stats, get_db_version
+from src.config import (
+    COMPARISON_RETRIEVER_K_PER_CV,
+    COMPARISON_MIN_CHUNKS_PER_CV,
+    COMPARISON_PROMPT_TEMPLATE,
+    RETRIEVER_SCORE_THRESHOLD
+)
 
 st.set_page_config(
     page_title="Análisis Comparativo",
@@ -25,12 +35,93 @@ st.set_page_config(
 st.title("📊 Análisis Comparativo de Candidatos")
 st.markdown("Selecciona a los finalistas para una comparación detallada de sus perfiles.")
 
+# El prompt es un único mensaje con dos variables: basta con `str.format`, sin
+# pasar por el parseo de plantillas de LangChain en cada llamada
+_FORMAT = COMPARISON_PROMPT_TEMPLATE.format
+
+# Distancia máxima de Chroma equivalente a `RETRIEVER_SCORE_THRESHOLD`
+MAX_RELEVANT_DISTANCE = 1 - RETRIEVER_SCORE_THRESHOLD
+
+# --- Lógica de Recuperación para la Comparación ---
+
+def retrieve_per_cv(question: str, selected_cvs: Tuple[str, ...], k: int) -> List[Document]:
+    """Recupera en paralelo hasta `k` fragmentos de cada CV seleccionado y los une.
+
+    La pregunta se convierte en embedding una sola vez y el mismo vector se usa
+    en todas las búsquedas. Cada búsqueda se fija a un único CV (filtro de
+    igualdad), lo que evita el filtro `$in` de Chroma y reparte el presupuesto
+    de fragmentos por igual. Los fragmentos con una relevancia inferior a
+    `RETRIEVER_SCORE_THRESHOLD` se descartan para no inflar el prompt, salvo
+    los `COMPARISON_MIN_CHUNKS_PER_CV` mejores de cada CV, que se conservan
+    siempre para que ningún candidato quede sin contexto.
+    """
+    vector_store = get_vector_store()
+    query_vector = vector_store.embeddings.embed_query(question)
+
+    def search(cv: str) -> List[Document]:
+        # Chroma devuelve distancias; en el espacio "ip" con vectores normalizados
+        # la distancia es 1 - similitud coseno. Los resultados llegan ordenados
+        # de más a menos relevante
+        results = vector_store.similarity_search_by_vector_with_relevance_scores(
+            query_vector, k=k, filter={'source': cv}
+        )
+        return [
+            doc for rank, (doc, distance) in enumerate(results)
+            if rank < COMPARISON_MIN_CHUNKS_PER_CV or distance <= MAX_RELEVANT_DISTANCE
+        ]
+
+    with ThreadPoolExecutor(max_workers=len(selected_cvs)) as executor:
+        results = list(executor.map(search, selected_cvs))
+    return merge_docs(results)
+
+# Clave de una comparativa: criterio, CVs seleccionados y versión de la DB
+ComparisonKey = Tuple[str, Tuple[str, ...], int]
+
+# Número máximo de comparativas guardadas en memoria
+MAX_CACHED_COMPARISONS = 128
+
+@st.cache_resource
+def get_comparison_cache() -> Dict[ComparisonKey, str]:
+    """Devuelve el almacén de comparativas ya generadas, compartido entre sesiones.
+
+    Es un diccionario explícito en lugar de `st.cache_data` porque la tabla se
+    muestra en streaming y solo se guarda una vez completa.
+    """
+    return {}
+
+def get_cached_comparison(criterion: str, cvs: Tuple[str, ...], db_version: int) -> Optional[str]:
+    """Devuelve la comparativa guardada para este criterio, CVs y versión de la DB."""
+    return get_comparison_cache().get((criterion, cvs, db_version))
+
+def put_cached_comparison(
+    criterion: str, cvs: Tuple[str, ...], db_version: int, result: str
+) -> None:
+    """Guarda una comparativa completa.
+
+    Se descartan las de versiones anteriores de la DB (`get_db_version`), que ya
+    no pueden consultarse, y las más antiguas si se supera el máximo.
+    """
+    cache = get_comparison_cache()
+    # Se recorre una copia de las claves: otras sesiones pueden escribir a la vez
+    for key in list(cache):
+        if key[2] != db_version:
+            cache.pop(key, None)
+    cache[(criterion, cvs, db_version)] = result
+    # Los diccionarios conservan el orden de inserción: las primeras son las más antiguas
+    for key in list(cache)[:-MAX_CACHED_COMPARISONS]:
+        cache.pop(key, None)
+
+def build_comparison_messages(criterion: str, docs: List[Document]) -> List[HumanMessage]:
+    """Construye el mensaje para el LLM a partir de los fragmentos recuperados."""
+    return [HumanMessage(content=_FORMAT(context=format_docs(docs), question=criterion))]
+
 # --- Carga de Datos y UI ---
 
-llm, _ = load_llm_and_retriever()
+# Solo se consultan las estadísticas: el LLM y el modelo de embeddings se cargan
+# al pulsar el botón, no en cada recarga de la página
 db_stats = get_db_stats()
 
-if not llm or db_stats["cv_count"] == 0:
+if db_stats["cv_count"] == 0:
     st.warning(
         """**La base de datos de CVs parece estar vacía.**
 
@@ -62,50 +153,41 @@ if len(selected_cvs) >= 2:
     if st.button("Generar Comparativa", type="primary", use_container_width=True):
         if not comparison_criterion.strip():
             st.warning("Por favor, introduce un criterio de comparación.")
+        elif load_llm_and_retriever()[0] is None:
+            # load_llm_and_retriever ya muestra el motivo (p. ej. falta la API key)
+            st.stop()
         else:
-            spinner_text = f"Generando comparación para: {', '.join(selected_cvs)}..."
-            with st.spinner(spinner_text):
-                try:
-                    # --- Lógica de Backend para la Comparación ---
-                    client = get_chroma_client() # Usa el cliente centralizado
-                    vector_store = Chroma(
-                        client=client,
-                        collection_name=CHROMA_COLLECTION_NAME,
-                        embedding_function=load_embedding_model()
-                    )
-                    
-                    search_kwargs = {
-                        'k': RETRIEVER_K,
-                        'filter': {
-                            'source': {
-                                '$in': selected_cvs
-                            }
-                        }
-                    }
-                    filtered_retriever = vector_store.as_retriever(
-                        search_kwargs=search_kwargs
-                    )
+            spinner_text = f"Buscando información de: {', '.join(selected_cvs)}..."
+            cvs = tuple(sorted(set(selected_cvs)))
+            db_version = get_db_version()
+            try:
+                # --- Lógica de Backend para la Comparación ---
+                comparison_result = get_cached_comparison(comparison_criterion, cvs, db_version)
+                if comparison_result is None:
+                    with st.spinner(spinner_text):
+                        docs = retrieve_per_cv(
+                            comparison_criterion, cvs, COMPARISON_RETRIEVER_K_PER_CV
+                        )
+                    missing_cvs = set(cvs) - {doc.metadata.get('source') for doc in docs}
+                    if missing_cvs:
+                        st.warning(
+                            "No se encontró información de: "
+                            f"{', '.join(sorted(missing_cvs))}. La comparativa puede estar incompleta."
+                        )
 
-                    prompt = ChatPromptTemplate.from_template(COMPARISON_PROMPT_TEMPLATE)
-                    parser = StrOutputParser()
-                    
-                    comparison_chain = (
-                        {
-                            "context": itemgetter("question") | filtered_retriever | format_docs,
-                            "question": itemgetter("question")
-                        }
-                        | prompt
-                        | llm
-                        | parser
-                    )
-                    
-                    response = comparison_chain.invoke(
-                        {"question": comparison_criterion}
+                st.markdown("---")
+                st.header("Resultados de la Comparativa")
+                if comparison_result is not None:
+                    st.markdown(comparison_result)
+                else:
+                    # La tabla se muestra a medida que el LLM genera los tokens
+                    # (llamada directa al LLM, sin la capa de Runnables de LCEL)
+                    messages = build_comparison_messages(comparison_criterion, docs)
+                    comparison_result = st.write_stream(
+                        chunk.content for chunk in get_llm().stream(messages)
                     )
-                    
-                    st.markdown("---")
-                    st.header("Resultados de la Comparativa")
-                    st.markdown(response)
+                    # Solo llega aquí una respuesta completa: se guarda para la próxima vez
+                    put_cached_comparison(comparison_criterion, cvs, db_version, comparison_result)
 
-                except Exception as e:
-                    st.error(f"Ocurrió un error al generar la comparación: {e}")
\ No newline at end of file
+            except Exception as e:
+                st.error(f"Ocurrió un error al generar la comparación: {e}")
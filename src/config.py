@@ -6,7 +6,7 @@ parámetros clave para que puedas ajustar el comportamiento del asistente
 de reclutamiento sin necesidad de tocar el código fuente.
 """
 from pathlib import Path
-from typing import Final, List
+from typing import Any, Dict, Final, List, Optional
 
 # ==============================================================================
 # SECCIÓN 1: RUTAS Y DIRECTORIOS
@@ -16,6 +16,9 @@ from typing import Final, List
 BASE_DIR: Final[Path] = Path(__file__).resolve().parent.parent
 CV_DIRECTORY: Final[Path] = BASE_DIR / "data" / "CVs"
 DB_DIRECTORY_BASE_NAME: Final[str] = "vector_db"
+# Caché en disco de los embeddings ya calculados (evita recalcularlos al volver
+# a cargar CVs con el mismo contenido).
+EMBEDDING_CACHE_DIRECTORY: Final[Path] = BASE_DIR / ".cache" / "embeddings"
 
 
 # ==============================================================================
@@ -25,6 +28,9 @@ DB_DIRECTORY_BASE_NAME: Final[str] = "vector_db"
 # --- Modelo de Embeddings (Para \"entender\" el texto de los CVs) ---
 # Modelo recomendado: \"intfloat/multilingual-e5-base\" (multilingüe, buen balance).
 EMBEDDING_MODEL_NAME: Final[str] = "intfloat/multilingual-e5-base"
+# Número de fragmentos que se procesan juntos al calcular los embeddings.
+# Lotes más grandes aprovechan mejor la CPU/GPU durante la carga de CVs.
+EMBEDDING_BATCH_SIZE: Final[int] = 128
 
 # --- Modelo de Lenguaje (Para \"generar\" las respuestas) ---
 # Modelo recomendado: \"gemini-1.5-flash-latest\" (rápido y de bajo coste).
@@ -35,6 +41,8 @@ LLM_MODEL_NAME: Final[str] = "gemini-1.5-flash-latest"
 # - Valores bajos (ej. 0.1): producen respuestas más directas y consistentes.
 # - Valores altos (ej. 0.9): producen respuestas más creativas y diversas.
 LLM_TEMPERATURE: Final[float] = 0.1
+# Tiempo máximo de espera (en segundos) para cada respuesta del modelo.
+LLM_TIMEOUT_SECONDS: Final[int] = 60
 
 
 # ==============================================================================
@@ -52,14 +60,65 @@ CHUNK_OVERLAP: Final[int] = 100
 PDF_PROCESSING_STRATEGY: Final[str] = "fast"
 # Idiomas a detectar en los CVs para mejorar la extracción de texto.
 PDF_PROCESSING_LANGUAGES: Final[List[str]] = ["spa", "eng"]
+# Detección de la estructura de tablas. Requiere modelos de layout y solo tiene
+# efecto con la estrategia \"hi_res\"; la mayoría de CVs no la necesitan.
+ENABLE_TABLE_INFERENCE: Final[bool] = False
+# Número máximo de PDFs que se procesan en paralelo (limitado también por los
+# núcleos de CPU disponibles).
+PDF_PROCESSING_MAX_WORKERS: Final[int] = 8
 
 # --- Búsqueda de Información (Retriever) ---
-# Número de fragmentos de CVs que la IA consultará para formular una respuesta.
+# Número de fragmentos de CVs que se recuperan de la base de datos en cada búsqueda.
 RETRIEVER_K: Final[int] = 20
 
+# --- Reordenamiento (Reranker) ---
+# Modelo que puntúa cada fragmento recuperado frente a la pregunta para quedarse
+# solo con los más relevantes. Alternativa multilingüe: "BAAI/bge-reranker-v2-m3".
+RERANKER_MODEL_NAME: Final[str] = "BAAI/bge-reranker-base"
+# Número de fragmentos que la IA consultará finalmente para formular una respuesta.
+RERANKER_TOP_N: Final[int] = 10
+
 # --- Ranking de Candidatos ---
 # Número máximo de candidatos a mostrar en la lista de resultados.
 TOP_K_CANDIDATES: Final[int] = 5
+# Pre-filtrado por el título del puesto: antes de la búsqueda semántica, la
+# consulta se restringe a los CVs que contienen alguna palabra del título. Es
+# más rápido y enfoca el contexto, pero pierde los CVs que describen el puesto
+# con otras palabras o en otro idioma (p. ej. "Científico de Datos" frente a
+# "Data Scientist"). Pon False para consultar siempre todos los CVs.
+ENABLE_TITLE_PREFILTER: Final[bool] = True
+# Si las palabras del título aparecen en más de esta fracción de los CVs, el
+# filtro apenas descarta nada y se consulta la base de datos completa.
+TITLE_PREFILTER_MAX_CV_FRACTION: Final[float] = 0.5
+# Máximo de fragmentos coincidentes que se leen para el pre-filtrado. Si se
+# alcanza, las palabras son demasiado comunes y el filtro también se descarta;
+# así su coste no crece con el tamaño de la base de datos.
+TITLE_PREFILTER_MAX_CHUNKS: Final[int] = 500
+
+# --- Análisis Comparativo ---
+# Número de fragmentos que se recuperan de cada CV seleccionado. Así cada
+# candidato aporta el mismo contexto y el prompt crece solo con los finalistas.
+COMPARISON_RETRIEVER_K_PER_CV: Final[int] = 5
+
+# Relevancia mínima (0-1, similitud coseno) que debe tener un fragmento para
+# llegar al prompt de la comparativa. Los fragmentos por debajo se descartan y
+# el contexto enviado al LLM es más corto.
+# Depende del modelo de embeddings: con multilingual-e5 las similitudes se
+# concentran entre 0.7 y 1.0 (incluso para textos no relacionados), así que un
+# umbral bajo no descartaría nada. Si cambias de modelo, ajusta este valor.
+RETRIEVER_SCORE_THRESHOLD: Final[float] = 0.8
+
+# Número de fragmentos más relevantes de cada CV que se conservan aunque no
+# superen el umbral anterior. Así ningún candidato llega a la comparativa sin
+# contexto si el umbral resulta demasiado estricto para su CV.
+COMPARISON_MIN_CHUNKS_PER_CV: Final[int] = 2
+
+# --- Chat con CVs ---
+# Número de turnos recientes (pregunta + respuesta) que siempre se envían
+# literalmente a la IA. Los turnos más antiguos se condensan en un resumen
+# cuando la conversación supera el doble de turnos, para que el tamaño del
+# prompt no crezca y el resumen no cueste una llamada extra en cada turno.
+CHAT_HISTORY_MAX_TURNS: Final[int] = 4
 
 
 # ==============================================================================
@@ -128,6 +187,12 @@ información de los CVs proporcionada en el contexto.
 ### CONTEXTO DE CVS
 {context}
 
+### RESUMEN DE LA CONVERSACIÓN ANTERIOR
+{history_summary}
+
+### ÚLTIMOS MENSAJES DE LA CONVERSACIÓN
+{chat_history}
+
 ### PREGUNTA DEL RECLUTADOR
 {question}
 
@@ -143,10 +208,29 @@ nombre del archivo del CV entre corchetes. Ejemplo: "María Rojas tiene una cert
 [cv_maria_rojas.pdf]".
 - **Manejo de Información Faltante:** Si la respuesta no se encuentra en el contexto,
 simplemente indica que no encontraste información sobre ese punto en los CVs analizados.
+- **Continuidad:** Usa el resumen y los últimos mensajes solo para entender a qué se refiere
+la pregunta (p. ej. "¿y ella?"); los datos de los candidatos deben salir del contexto de CVs.
 
 ### RESPUESTA DEL ASISTENTE
 """
 
+# --- Módulo: Chat con CVs (Resumen del historial) ---
+CHAT_SUMMARY_PROMPT_TEMPLATE: Final[str] = """
+### ROL Y OBJETIVO
+Mantienes un resumen breve de una conversación entre un reclutador y un asistente que
+responde preguntas sobre CVs.
+
+### RESUMEN ACTUAL
+{history_summary}
+
+### NUEVOS MENSAJES
+{new_messages}
+
+### INSTRUCCIONES
+Devuelve el resumen actualizado en no más de 5 frases. Conserva los candidatos, archivos y
+criterios mencionados. No añadas información que no aparezca en los mensajes.
+"""
+
 # --- Módulo: Análisis Comparativo ---
 COMPARISON_PROMPT_TEMPLATE: Final[str] = """
 ### ROL Y OBJETIVO
@@ -193,5 +277,45 @@ por qué. Si ningún candidato es recomendable, indícalo también.
 # embeddings para evitar conflictos si se cambia de modelo.
 DB_DIRECTORY: Final[Path] = BASE_DIR / f"{DB_DIRECTORY_BASE_NAME}_{EMBEDDING_MODEL_NAME.replace('/', '_')}"
 
+# Fichero auxiliar con los CVs indexados y su número de fragmentos. Permite
+# calcular las estadísticas sin leer los metadatos de todos los fragmentos.
+SOURCES_MANIFEST_PATH: Final[Path] = DB_DIRECTORY / "_sources.json"
+# Fichero auxiliar con el hash del contenido del PDF indexado de cada CV. Los
+# archivos idénticos que se vuelvan a cargar se omiten sin procesarlos.
+FILE_HASHES_MANIFEST_PATH: Final[Path] = DB_DIRECTORY / "_file_hashes.json"
+# Fichero auxiliar con la versión de la DB: cambia cada vez que se cargan CVs o
+# se reinicia la base de datos, e invalida las respuestas cacheadas del LLM.
+DB_VERSION_PATH: Final[Path] = DB_DIRECTORY / "_db_version.json"
+
 # Nombre de la "tabla" interna en la base de datos.
-CHROMA_COLLECTION_NAME: Final[str] = "cv_collection"
\ No newline at end of file
+CHROMA_COLLECTION_NAME: Final[str] = "cv_collection"
+
+# Parámetros del índice HNSW de la colección (solo se aplican al crearla).
+# - space: métrica de similitud entre vectores. Los embeddings ya se normalizan
+#   al calcularlos, así que el producto interno ("ip") ordena igual que el
+#   coseno sin volver a normalizar cada vector en el índice.
+# - M / construction_ef: conexiones por nodo y amplitud de la búsqueda al
+#   construir el índice; equilibran velocidad de carga y calidad de búsqueda.
+CHROMA_COLLECTION_METADATA: Final[Dict[str, Any]] = {
+    "hnsw:space": "ip",
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 64,
+}
+
+# Número de fragmentos que se insertan en cada llamada a la base de datos.
+# Lotes de 100-250 reparten el coste de cada transacción sin bloquear la
+# carga durante demasiado tiempo.
+INGEST_BATCH_SIZE: Final[int] = 128
+
+# Servidor de ChromaDB opcional. Con `None` se usa la base de datos local en
+# DB_DIRECTORY; con un host, la app se conecta a un servidor Chroma por HTTP y
+# envía varios lotes de inserción a la vez.
+# IMPORTANTE: los ficheros auxiliares (fuentes, hashes de PDFs y versión) se siguen
+# guardando en el disco local, por lo que el modo servidor admite una sola
+# instancia de la app por servidor. Con varias, sus estadísticas y la detección
+# de PDFs repetidos no coincidirían, y reiniciar la DB desde una instancia
+# dejaría desactualizados los ficheros de las demás.
+CHROMA_SERVER_HOST: Final[Optional[str]] = None
+CHROMA_SERVER_PORT: Final[int] = 8000
+# Número máximo de lotes que se envían en paralelo al servidor de Chroma.
+CHROMA_MAX_CONCURRENT_BATCHES: Final[int] = 4
\ No newline at end of file
@@ -1,9 +1,59 @@
 import streamlit as st
+import torch
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 from langchain_huggingface import HuggingFaceEmbeddings
+from sentence_transformers import CrossEncoder
 
-from .config import EMBEDDING_MODEL_NAME
+from .config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CACHE_DIRECTORY,
+    RERANKER_MODEL_NAME
+)
 
 @st.cache_resource
 def load_embedding_model() -> HuggingFaceEmbeddings:
-    """Carga y cachea el modelo de embeddings de HuggingFace."""
-    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
\ No newline at end of file
+    """Carga y cachea el modelo de embeddings de HuggingFace.
+
+    Usa la GPU en media precisión (FP16) si está disponible; en CPU se mantiene
+    FP32, ya que FP16 no acelera la inferencia en la mayoría de procesadores.
+    """
+    model_kwargs = {"device": "cpu"}
+    if torch.cuda.is_available():
+        model_kwargs = {"device": "cuda", "model_kwargs": {"torch_dtype": torch.float16}}
+
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE, "normalize_embeddings": True}
+    )
+
+@st.cache_resource
+def load_cached_embedding_model() -> CacheBackedEmbeddings:
+    """Envuelve el modelo de embeddings con una caché en disco.
+
+    Cada fragmento se identifica por el hash BLAKE2b de su contenido dentro del
+    espacio de nombres del modelo y su configuración, de modo que los fragmentos ya vistos (en este
+    u otro CV) no vuelven a pasar por el modelo al cargar CVs.
+    """
+    embeddings = load_embedding_model()
+    # Los vectores dependen del modelo, de la normalización y de la precisión
+    # (FP16 en GPU): todo ello forma parte del espacio de nombres para no
+    # reutilizar vectores calculados con otra configuración.
+    normalize = embeddings.encode_kwargs.get("normalize_embeddings", False)
+    torch_dtype = embeddings.model_kwargs.get("model_kwargs", {}).get("torch_dtype")
+    precision = "fp16" if torch_dtype == torch.float16 else "fp32"
+    namespace = f"{embeddings.model_name}:normalize={normalize}:{precision}"
+
+    return CacheBackedEmbeddings.from_bytes_store(
+        embeddings,
+        LocalFileStore(str(EMBEDDING_CACHE_DIRECTORY)),
+        namespace=namespace,
+        key_encoder="blake2b"  # Más rápido que el SHA-1 por defecto y sin colisiones conocidas
+    )
+
+@st.cache_resource
+def load_reranker_model() -> CrossEncoder:
+    """Carga y cachea el modelo cross-encoder usado para reordenar fragmentos."""
+    return CrossEncoder(RERANKER_MODEL_NAME)
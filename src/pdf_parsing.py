@@ -0,0 +1,58 @@
+"""
+Módulo para el análisis y la fragmentación de PDFs.
+
+Contiene la función que se ejecuta en los procesos del pool de `vector_store`.
+Está separada de ese módulo para que cada proceso solo importe `unstructured`
+y la configuración, y no cargue torch, ChromaDB ni Streamlit para analizar PDFs.
+"""
+import io
+import ntpath
+from typing import List
+
+from langchain_core.documents import Document
+from unstructured.partition.pdf import partition_pdf
+from unstructured.chunking.title import chunk_by_title
+
+from .config import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    PDF_PROCESSING_STRATEGY,
+    PDF_PROCESSING_LANGUAGES,
+    ENABLE_TABLE_INFERENCE
+)
+
+def partition_and_chunk_pdf(file_bytes: bytes, file_name: str) -> List[Document]:
+    """Extrae el contenido de un único PDF y lo divide en fragmentos.
+
+    Se ejecuta en un proceso aparte, por lo que recibe los bytes del archivo
+    (serializables) en lugar del objeto de Streamlit y no usa la UI.
+    """
+    # Solo se guarda el nombre del archivo: es el que muestran y filtran las páginas,
+    # y así no hay que recortar rutas en cada consulta
+    source_name = ntpath.basename(file_name)
+    elements = partition_pdf(
+        file=io.BytesIO(file_bytes),  # partition_pdf puede manejar objetos de archivo en memoria
+        strategy=PDF_PROCESSING_STRATEGY,
+        languages=PDF_PROCESSING_LANGUAGES,
+        infer_table_structure=ENABLE_TABLE_INFERENCE,
+        extract_images_in_pdf=False,
+        include_page_breaks=False,
+    )
+
+    chunks = chunk_by_title(
+        elements=elements,
+        max_characters=CHUNK_SIZE,
+        new_after_n_chars=int(CHUNK_SIZE * 0.8),
+        combine_text_under_n_chars=int(CHUNK_OVERLAP / 2)
+    )
+
+    return [
+        Document(
+            page_content=chunk.text,
+            metadata={
+                "source": source_name,
+                "page_number": chunk.metadata.page_number or 1
+            }
+        )
+        for chunk in chunks
+    ]
@@ -5,30 +5,99 @@ Este módulo se encarga de inicializar los componentes de LangChain, como el
 modelo de embeddings, el LLM y el retriever.
 """
 import os
-import ntpath
-from typing import Tuple, List, Optional
+import functools
+import threading
+from operator import itemgetter
+from typing import Any, Dict, Tuple, List, Optional, Set
 
 import streamlit as st
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.documents import Document
+from langchain_core.runnables import Runnable, RunnableLambda, RunnableParallel
 from langchain_core.vectorstores import VectorStoreRetriever
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 
 from .config import (
-    EMBEDDING_MODEL_NAME,
     LLM_MODEL_NAME,
     LLM_TEMPERATURE,
+    LLM_TIMEOUT_SECONDS,
     RETRIEVER_K,
-    CHROMA_COLLECTION_NAME
+    RERANKER_TOP_N,
+    CHROMA_COLLECTION_NAME,
+    CHROMA_COLLECTION_METADATA
 )
 from .vector_store import get_chroma_client, get_db_stats
 
+@functools.cache
+def _load_env() -> Optional[str]:
+    """Carga el archivo .env una sola vez por proceso y devuelve la API key de Google."""
+    load_dotenv()
+    return os.getenv("GOOGLE_API_KEY")
+
 # Cargar variables de entorno desde el archivo .env
-load_dotenv()
+_load_env()
+
+from .models import load_embedding_model, load_reranker_model
+
+# Instancia única del LLM para todo el proceso. A diferencia de la caché de
+# Streamlit, no se descarta al limpiar los recursos tras cargar CVs, por lo que
+# las conexiones con la API de Gemini se reutilizan entre páginas y sesiones.
+_LLM: Optional[ChatGoogleGenerativeAI] = None
+_LLM_LOCK = threading.Lock()
+
+def get_llm() -> ChatGoogleGenerativeAI:
+    """Devuelve la instancia única del LLM de Gemini, creándola la primera vez.
 
-from .models import load_embedding_model
+    La API key se lee del entorno cargado al importar el módulo. El bloqueo con doble
+    comprobación evita que dos sesiones simultáneas creen clientes distintos.
+    """
+    global _LLM
+    if _LLM is None:
+        with _LLM_LOCK:
+            if _LLM is None:
+                _LLM = ChatGoogleGenerativeAI(
+                    model=LLM_MODEL_NAME,
+                    google_api_key=_load_env(),
+                    temperature=LLM_TEMPERATURE,
+                    timeout=LLM_TIMEOUT_SECONDS
+                )
+    return _LLM
+
+@st.cache_resource
+def get_vector_store() -> Chroma:
+    """Crea y cachea el vector store de LangChain sobre la colección de ChromaDB.
+
+    Reutiliza el cliente centralizado y el modelo de embeddings cacheado, de modo
+    que todas las páginas comparten una única instancia entre ejecuciones.
+    """
+    return Chroma(
+        client=get_chroma_client(),
+        collection_name=CHROMA_COLLECTION_NAME,
+        collection_metadata=CHROMA_COLLECTION_METADATA,
+        embedding_function=load_embedding_model()
+    )
+
+# Una entrada por cada selección de CVs distinta: se acota para no acumularlas
+@st.cache_resource(max_entries=32)
+def get_filtered_retriever(
+    sources: Tuple[str, ...] = (), k: int = RETRIEVER_K
+) -> VectorStoreRetriever:
+    """Crea y cachea un retriever restringido a un conjunto de CVs.
+
+    Args:
+        sources: Nombres de los CVs, ordenados y sin duplicados, para que la
+            misma selección reutilice siempre la misma entrada de caché. Si está
+            vacío, el retriever consulta la base de datos completa.
+        k: Número de fragmentos a recuperar.
+    """
+    search_kwargs: Dict[str, Any] = {'k': k}
+    if len(sources) == 1:
+        # La igualdad simple es el filtro más rápido de Chroma
+        search_kwargs['filter'] = {'source': sources[0]}
+    elif sources:
+        search_kwargs['filter'] = {'source': {'$in': list(sources)}}
+    return get_vector_store().as_retriever(search_kwargs=search_kwargs)
 
 @st.cache_resource
 def load_llm_and_retriever() -> Tuple[Optional[ChatGoogleGenerativeAI], Optional[VectorStoreRetriever]]:
@@ -43,8 +112,7 @@ def load_llm_and_retriever() -> Tuple[Optional[ChatGoogleGenerativeAI], Optional
     if db_stats["cv_count"] == 0:
         return None, None
 
-    google_api_key = os.getenv("GOOGLE_API_KEY")
-    if not google_api_key:
+    if not _load_env():
         st.error(
             "API Key de Google no encontrada. Asegúrate de crear un archivo .env "
             "y añadir GOOGLE_API_KEY='tu-clave-aqui'"
@@ -52,28 +120,60 @@ def load_llm_and_retriever() -> Tuple[Optional[ChatGoogleGenerativeAI], Optional
         return None, None
 
     try:
-        embeddings = load_embedding_model()
-        client = get_chroma_client() # Usa el cliente centralizado
-        
-        vector_store = Chroma(
-            client=client,
-            collection_name=CHROMA_COLLECTION_NAME,
-            embedding_function=embeddings
-        )
-        
-        retriever = vector_store.as_retriever(search_kwargs={'k': RETRIEVER_K})
-        
-        llm = ChatGoogleGenerativeAI(
-            model=LLM_MODEL_NAME,
-            google_api_key=google_api_key,
-            temperature=LLM_TEMPERATURE
-        )
-        
-        return llm, retriever
+        return get_llm(), get_filtered_retriever()
     except Exception as e:
         st.error(f"Error al inicializar los servicios de IA: {e}")
         return None, None
 
+def rerank_docs(
+    question: str, docs: List[Document], top_n: int = RERANKER_TOP_N
+) -> List[Document]:
+    """Reordena los documentos con un cross-encoder y conserva los más relevantes.
+
+    Args:
+        question: La pregunta con la que se recuperaron los documentos.
+        docs: Los documentos recuperados de la base de datos.
+        top_n: Número máximo de documentos a conservar.
+
+    Returns:
+        Los `top_n` documentos con mayor puntuación, de más a menos relevante.
+    """
+    if len(docs) <= top_n:
+        return docs
+
+    scores = load_reranker_model().predict([(question, doc.page_content) for doc in docs])
+    ranked = sorted(zip(scores, docs), key=itemgetter(0), reverse=True)
+    return [doc for _, doc in ranked[:top_n]]
+
+def build_context_chain(docs_retriever: Runnable) -> Runnable:
+    """Crea el paso de la cadena que recupera, reordena y formatea el contexto.
+
+    Args:
+        docs_retriever: Runnable que recibe la entrada de la cadena y devuelve
+            los documentos recuperados, p. ej. `itemgetter("question") | retriever`.
+
+    Returns:
+        Un Runnable que espera una entrada con la clave "question" y devuelve el
+        contexto listo para insertarse en el prompt.
+    """
+    return (
+        RunnableParallel(docs=docs_retriever, question=itemgetter("question"))
+        | RunnableLambda(lambda inputs: rerank_docs(inputs["question"], inputs["docs"]))
+        | format_docs
+    )
+
+def merge_docs(doc_lists: List[List[Document]]) -> List[Document]:
+    """Une varias listas de documentos recuperados eliminando los duplicados."""
+    seen: Set[Tuple[str, str]] = set()
+    merged: List[Document] = []
+    for docs in doc_lists:
+        for doc in docs:
+            key = (doc.metadata.get('source', 'N/A'), doc.page_content)
+            if key not in seen:
+                seen.add(key)
+                merged.append(doc)
+    return merged
+
 def format_docs(docs: List[Document]) -> str:
     """Formatea los documentos recuperados para ser insertados en el prompt.
 
@@ -84,9 +184,13 @@ def format_docs(docs: List[Document]) -> str:
         Un string único con el contenido de todos los documentos, cada uno
         delimitado por un encabezado que indica su archivo de origen.
     """
-    return "\n\n".join(
-        f"--- INICIO DEL FRAGMENTO DEL CV: {ntpath.basename(doc.metadata.get('source', 'N/A'))} ---"
-        f"{doc.page_content}\n"
-        f"--- FIN DEL FRAGMENTO DEL CV: {ntpath.basename(doc.metadata.get('source', 'N/A'))} ---"
-        for doc in docs
-    )
\ No newline at end of file
+    parts: List[str] = []
+    for doc in docs:
+        # `source` ya guarda solo el nombre del archivo (se recorta al ingerir)
+        name = doc.metadata.get('source', 'N/A')
+        parts.append(
+            f"--- INICIO DEL FRAGMENTO DEL CV: {name} ---\n"
+            f"{doc.page_content}\n"
+            f"--- FIN DEL FRAGMENTO DEL CV: {name} ---"
+        )
+    return "\n\n".join(parts)
\ No newline at end of file
@@ -0,0 +1,41 @@
+"""
+Módulo de Esquemas de Datos.
+
+Define la estructura que deben tener las respuestas de la IA. Validarlas una
+sola vez, justo al recibirlas, permite que el resto de la aplicación trabaje
+con objetos tipados y detecta pronto las respuestas mal formadas.
+"""
+from enum import Enum
+from typing import Dict, Final, List
+
+from pydantic import BaseModel, TypeAdapter
+
+
+class Affinity(str, Enum):
+    """Nivel de afinidad de un candidato con el puesto buscado."""
+    ALTA = "Alta"
+    MEDIA = "Media"
+    BAJA = "Baja"
+    NA = "N/A"
+
+
+class Candidate(BaseModel):
+    """Evaluación de un candidato devuelta por el módulo de Ranking."""
+    file_name: str
+    affinity: Affinity
+    is_job_title_match: bool
+    job_title_found: str
+    summary: str
+    key_requirements_analysis: str
+
+
+# Puntuación usada para ordenar a los candidatos de mayor a menor afinidad.
+AFFINITY_SCORE: Final[Dict[Affinity, int]] = {
+    Affinity.ALTA: 3,
+    Affinity.MEDIA: 2,
+    Affinity.BAJA: 1,
+    Affinity.NA: 0,
+}
+
+# Validador de la lista completa de candidatos que devuelve el LLM.
+CANDIDATE_LIST: Final[TypeAdapter[List[Candidate]]] = TypeAdapter(List[Candidate])
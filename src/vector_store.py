@@ -6,26 +6,47 @@ la carga, el procesamiento y la eliminación de documentos.
 Implementa un patrón de cliente único para evitar conflictos de conexión.
 """
 import os
+import asyncio
+import json
+import time
+import hashlib
+import tempfile
 import ntpath
-from typing import List, Dict, Any, Set, IO
+import threading
+import multiprocessing
+from collections import Counter
+from pathlib import Path
+from contextlib import closing
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Set, IO, Tuple, Optional, Iterator
 
+import numpy as np
 import streamlit as st
 import chromadb
+from chromadb.api import AsyncClientAPI
 from chromadb.config import Settings
+from chromadb.api.models.Collection import Collection
 from langchain_core.documents import Document
-from langchain_chroma import Chroma
-from unstructured.partition.pdf import partition_pdf
-from unstructured.chunking.title import chunk_by_title
 
 from .config import (
     DB_DIRECTORY,
-    CHUNK_SIZE,
-    CHUNK_OVERLAP,
+    SOURCES_MANIFEST_PATH,
+    FILE_HASHES_MANIFEST_PATH,
+    DB_VERSION_PATH,
     CHROMA_COLLECTION_NAME,
-    PDF_PROCESSING_STRATEGY,
-    PDF_PROCESSING_LANGUAGES
+    CHROMA_COLLECTION_METADATA,
+    PDF_PROCESSING_MAX_WORKERS,
+    INGEST_BATCH_SIZE,
+    CHROMA_SERVER_HOST,
+    CHROMA_SERVER_PORT,
+    CHROMA_MAX_CONCURRENT_BATCHES,
+    ENABLE_TITLE_PREFILTER,
+    TITLE_PREFILTER_MAX_CV_FRACTION,
+    TITLE_PREFILTER_MAX_CHUNKS
 )
-from .models import load_embedding_model
+from .models import load_cached_embedding_model
+from .pdf_parsing import partition_and_chunk_pdf
 
 # --- Conexión Única y Centralizada a ChromaDB ---
 
@@ -34,12 +55,77 @@ def get_chroma_client() -> chromadb.Client:
     """
     Crea y cachea una instancia única del cliente de ChromaDB.
     Esta es la única función que debe crear un PersistentClient.
+    Si se ha configurado un servidor de Chroma, devuelve un cliente HTTP; su
+    contrapartida asíncrona para las inserciones es `_get_async_chroma_client`.
     """
+    if CHROMA_SERVER_HOST:
+        return chromadb.HttpClient(
+            host=CHROMA_SERVER_HOST,
+            port=CHROMA_SERVER_PORT,
+            settings=Settings(allow_reset=True)
+        )
     return chromadb.PersistentClient(
         path=str(DB_DIRECTORY),
         settings=Settings(allow_reset=True)
     )
 
+# Cliente asíncrono único para el servidor de Chroma (solo en modo servidor).
+# Vive en un bucle de eventos propio, en un hilo aparte, para poder reutilizarse
+# entre cargas: un cliente asíncrono queda ligado al bucle en el que se creó.
+_ASYNC_CHROMA: Optional[Tuple[asyncio.AbstractEventLoop, AsyncClientAPI]] = None
+_ASYNC_CHROMA_LOCK = threading.Lock()
+
+def _get_async_chroma_client() -> Tuple[asyncio.AbstractEventLoop, AsyncClientAPI]:
+    """Devuelve el cliente asíncrono del servidor de Chroma y su bucle de eventos.
+
+    Se crea una sola vez por proceso; las corrutinas que lo usan deben
+    ejecutarse en el bucle devuelto (`asyncio.run_coroutine_threadsafe`).
+    """
+    global _ASYNC_CHROMA
+    with _ASYNC_CHROMA_LOCK:
+        if _ASYNC_CHROMA is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="chroma-async", daemon=True).start()
+            client = asyncio.run_coroutine_threadsafe(
+                chromadb.AsyncHttpClient(host=CHROMA_SERVER_HOST, port=CHROMA_SERVER_PORT), loop
+            ).result()
+            _ASYNC_CHROMA = (loop, client)
+        return _ASYNC_CHROMA
+
+# --- Pool Único de Procesos para Analizar PDFs ---
+
+# Se comparte en todo el proceso y, como el LLM, sobrevive a la limpieza de la
+# caché de recursos tras cada carga: los procesos ya arrancados (con unstructured
+# importado) se reutilizan entre cargas y sesiones.
+_PDF_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_PDF_EXECUTOR_LOCK = threading.Lock()
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    """Devuelve el pool de procesos para analizar PDFs, creándolo la primera vez.
+
+    Los procesos se crean con `spawn`: hacer `fork` de un servidor de Streamlit
+    con varios hilos (y posible estado de CUDA/torch del modelo de embeddings)
+    puede dejar bloqueos heredados y colgar o romper los procesos hijos. La
+    función que ejecutan vive en `pdf_parsing`, de modo que cada proceso solo
+    importa `unstructured` y no este módulo (con torch, ChromaDB y Streamlit).
+    """
+    global _PDF_EXECUTOR
+    with _PDF_EXECUTOR_LOCK:
+        if _PDF_EXECUTOR is None:
+            _PDF_EXECUTOR = ProcessPoolExecutor(
+                max_workers=max(1, min(PDF_PROCESSING_MAX_WORKERS, os.cpu_count() or 1)),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _PDF_EXECUTOR
+
+def _discard_pdf_executor(executor: ProcessPoolExecutor) -> None:
+    """Descarta un pool roto (p. ej. si un proceso murió) para que se cree uno nuevo."""
+    global _PDF_EXECUTOR
+    with _PDF_EXECUTOR_LOCK:
+        if _PDF_EXECUTOR is executor:
+            _PDF_EXECUTOR = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
 # --- Funciones Públicas de Alto Nivel ---
 
 def procesar_archivos_cargados(archivos_cargados: List[st.runtime.uploaded_file_manager.UploadedFile]) -> None:
@@ -48,16 +134,58 @@ def procesar_archivos_cargados(archivos_cargados: List[st.runtime.uploaded_file_
         st.warning("No has seleccionado ningún archivo para cargar.")
         return
 
-    with st.spinner(f"Procesando {len(archivos_cargados)} archivo(s)... Esto puede tardar un momento."):
-        all_chunks = _chunk_archivos(archivos_cargados)
+    # Los PDFs con el mismo contenido que uno ya indexado se omiten por completo.
+    # Cada CV se identifica por su nombre de archivo, así que en una misma carga
+    # no puede haber dos archivos con el mismo nombre.
+    hash_by_source = _read_file_hashes()
+    indexed_hashes: Set[str] = set(hash_by_source.values())
+    pending_hashes: Dict[str, str] = {}
+    archivos_nuevos: List[st.runtime.uploaded_file_manager.UploadedFile] = []
+    for archivo in archivos_cargados:
+        source = ntpath.basename(archivo.name)
+        if source in pending_hashes:
+            st.warning(f"Hay más de un archivo llamado '{source}' en la carga; solo se procesa el primero.")
+            continue
+        file_hash = hashlib.blake2b(archivo.getvalue()).hexdigest()
+        if file_hash in indexed_hashes:
+            st.info(f"'{archivo.name}' ya está indexado, se omite.")
+            continue
+        if file_hash in pending_hashes.values():
+            st.info(f"'{archivo.name}' tiene el mismo contenido que otro archivo de la carga, se omite.")
+            continue
+        pending_hashes[source] = file_hash
+        archivos_nuevos.append(archivo)
+
+    if not archivos_nuevos:
+        return
+
+    with st.spinner(f"Procesando {len(archivos_nuevos)} archivo(s)... Esto puede tardar un momento."):
+        # Cada archivo se indexa en cuanto termina su análisis, mientras los
+        # procesos siguen analizando el resto: CPU y modelo de embeddings trabajan a la vez
+        chunk_count = 0
+        # Vectores ya calculados en esta carga: el texto repetido entre CVs no se recalcula
+        vector_memo: Dict[str, np.ndarray] = {}
+        try:
+            with closing(_chunk_archivos(archivos_nuevos)) as chunk_lists:
+                for file_chunks in chunk_lists:
+                    _add_chunks_to_db(file_chunks, vector_memo)
+                    chunk_count += len(file_chunks)
+                    # Se registra cada archivo al indexarlo: si falla uno posterior,
+                    # los ya indexados no se vuelven a procesar
+                    source = file_chunks[0].metadata['source']
+                    hash_by_source[source] = pending_hashes[source]
+                    _write_manifest(FILE_HASHES_MANIFEST_PATH, hash_by_source)
+        finally:
+            if chunk_count:
+                _bump_db_version()
+                get_db_stats.clear()
+                _clear_streamlit_caches()
         
-        if not all_chunks:
+        if not chunk_count:
             st.error("No se pudo extraer contenido de los archivos seleccionados.")
             return
 
-        _add_chunks_to_db(all_chunks)
-        st.success(f"✅ {len(archivos_cargados)} CV(s) procesados y añadidos a la base de datos.")
-        _clear_streamlit_caches()
+        st.success(f"✅ {len(archivos_nuevos)} CV(s) procesados y añadidos a la base de datos.")
 
 def eliminar_toda_la_base_de_datos() -> None:
     """
@@ -67,88 +195,309 @@ def eliminar_toda_la_base_de_datos() -> None:
         try:
             client = get_chroma_client()
             client.reset()
+            SOURCES_MANIFEST_PATH.unlink(missing_ok=True)
+            FILE_HASHES_MANIFEST_PATH.unlink(missing_ok=True)
+            _bump_db_version()
+            get_db_stats.clear()
             _clear_streamlit_caches()
             st.success("✅ Base de datos reiniciada con éxito.")
         except Exception as e:
             st.error(f"Ocurrió un error al reiniciar la base de datos: {e}")
 
-@st.cache_data(ttl=30)
+@st.cache_data(ttl=60, show_spinner=False)
 def get_db_stats() -> Dict[str, Any]:
-    """Consulta la DB para obtener estadísticas sobre los datos indexados."""
-    try:
-        client = get_chroma_client()
-        collection = client.get_collection(name=CHROMA_COLLECTION_NAME)
-        
-        if collection.count() == 0:
-            return {"cv_count": 0, "chunk_count": 0, "cv_names": []}
+    """Consulta la DB para obtener estadísticas sobre los datos indexados.
 
-        metadatas: List[Dict[str, Any]] = collection.get(include=["metadatas"])['metadatas']
-        chunk_count: int = len(metadatas)
-        
-        unique_sources: Set[str] = set(
-            ntpath.basename(meta['source']) for meta in metadatas if 'source' in meta
-        )
-        
-        return {
-            "cv_count": len(unique_sources),
-            "chunk_count": chunk_count,
-            "cv_names": sorted(list(unique_sources))
-        }
+    Todas las cifras salen del fichero auxiliar de fuentes (fragmentos por CV),
+    sin consultar la colección. Las bases de datos creadas antes de existir ese
+    fichero lo generan una vez desde los metadatos.
+    """
+    try:
+        source_counts = _load_source_counts()
     except Exception:
         return {"cv_count": 0, "chunk_count": 0, "cv_names": []}
 
+    return {
+        "cv_count": len(source_counts),
+        "chunk_count": sum(source_counts.values()),
+        "cv_names": sorted(source_counts)
+    }
+
+def get_db_version() -> int:
+    """Devuelve la versión actual de la DB, para usarla como clave de las cachés.
+
+    Cambia en cada carga de CVs y en cada reinicio, incluso si el número de
+    fragmentos queda igual. Se lee del disco en cada llamada (no pasa por la
+    caché de `get_db_stats`), así que nunca va por detrás de la base de datos.
+    """
+    version = _read_manifest(DB_VERSION_PATH)
+    return version if isinstance(version, int) else 0
+
+def find_sources_with_keywords(keywords: Tuple[str, ...]) -> List[str]:
+    """Devuelve los CVs cuyo texto contiene alguna de las palabras clave.
+
+    Se usa como pre-filtro barato (`where_document` de Chroma) antes de la
+    búsqueda semántica. La comparación de Chroma distingue mayúsculas, por lo
+    que se prueban las variantes más habituales de cada palabra.
+
+    Una lista vacía significa "sin filtro" (consultar todos los CVs). Se
+    devuelve también cuando el filtro está desactivado o es demasiado amplio:
+    si coinciden más de `TITLE_PREFILTER_MAX_CHUNKS` fragmentos o más de la
+    fracción `TITLE_PREFILTER_MAX_CV_FRACTION` de los CVs. Los CVs que
+    describen el puesto con otras palabras (o en otro idioma) quedan fuera
+    cuando el filtro se aplica; ver `ENABLE_TITLE_PREFILTER`.
+    """
+    if not ENABLE_TITLE_PREFILTER:
+        return []
+
+    variants: Set[str] = set()
+    for keyword in keywords:
+        variants.update({keyword, keyword.lower(), keyword.capitalize(), keyword.upper()})
+    if not variants:
+        return []
+
+    clauses = [{"$contains": variant} for variant in sorted(variants)]
+    where_document = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+    try:
+        # Solo se leen metadatos y con un límite: el coste no crece con la DB
+        metadatas = _get_collection().get(
+            where_document=where_document,
+            include=["metadatas"],
+            limit=TITLE_PREFILTER_MAX_CHUNKS
+        )['metadatas']
+    except Exception:
+        return []
+    if len(metadatas) >= TITLE_PREFILTER_MAX_CHUNKS:
+        return []
+
+    sources = {meta['source'] for meta in metadatas if 'source' in meta}
+    if len(sources) > TITLE_PREFILTER_MAX_CV_FRACTION * len(_load_source_counts()):
+        return []
+    return sorted(sources)
+
 # --- Funciones Privadas de Lógica Interna ---
 
-def _chunk_archivos(archivos: List[IO]) -> List[Document]:
-    """Función central que parte y divide una lista de archivos (en memoria o en disco)."""
-    all_chunks: List[Document] = []
+def _chunk_archivos(archivos: List[IO]) -> Iterator[List[Document]]:
+    """Función central que parte y divide una lista de archivos (en memoria o en disco).
+
+    El análisis de PDFs consume CPU, así que cada archivo se procesa en un
+    proceso del pool compartido (los hilos quedarían limitados por el GIL). A los
+    procesos solo se envían los bytes y el nombre del archivo; la interacción
+    con la UI (barra de progreso y avisos) se mantiene en el proceso principal.
+
+    Devuelve los fragmentos de cada archivo según van terminando, de modo que
+    quien los consume puede indexarlos sin esperar al resto de archivos.
+    """
     progress_bar = st.progress(0, "Iniciando procesamiento...")
+    executor = _get_pdf_executor()
+    futures: Dict[Future, str] = {}
+    try:
+        for archivo in archivos:
+            file_name = getattr(archivo, 'name', str(archivo))
+            file_bytes = archivo.getvalue() if hasattr(archivo, 'getvalue') else archivo.read()
+            futures[executor.submit(partition_and_chunk_pdf, file_bytes, file_name)] = file_name
 
-    for i, archivo in enumerate(archivos):
-        file_name = getattr(archivo, 'name', str(archivo))
-        progress_text = f"Procesando: {ntpath.basename(file_name)}..."
-        progress_bar.progress((i + 1) / len(archivos), text=progress_text)
+        for i, future in enumerate(as_completed(futures)):
+            file_name = futures[future]
+            progress_text = f"Procesado: {ntpath.basename(file_name)}"
+            progress_bar.progress((i + 1) / len(archivos), text=progress_text)
 
-        try:
-            elements = partition_pdf(
-                file=archivo,  # partition_pdf puede manejar objetos de archivo en memoria
-                strategy=PDF_PROCESSING_STRATEGY,
-                languages=PDF_PROCESSING_LANGUAGES,
-                infer_table_structure=True,
-            )
-            
-            chunks = chunk_by_title(
-                elements=elements,
-                max_characters=CHUNK_SIZE,
-                new_after_n_chars=int(CHUNK_SIZE * 0.8),
-                combine_text_under_n_chars=int(CHUNK_OVERLAP / 2)
-            )
+            try:
+                file_chunks = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    _discard_pdf_executor(executor)
+                st.warning(f"No se pudo procesar el archivo '{file_name}'. Error: {e}")
+                continue
 
-            for chunk in chunks:
-                metadata = {"source": file_name, "page_number": chunk.metadata.page_number or 1}
-                doc = Document(page_content=chunk.text, metadata=metadata)
-                all_chunks.append(doc)
+            if file_chunks:
+                yield file_chunks
+    except BrokenProcessPool as e:
+        _discard_pdf_executor(executor)
+        st.warning(f"No se pudieron procesar los archivos. Error: {e}")
+    finally:
+        # El pool es compartido: si se abandona la carga a mitad, se cancelan
+        # los archivos pendientes para no dejarlos ocupando procesos
+        for future in futures:
+            future.cancel()
+        # La barra se retira aunque quien consume los fragmentos falle a mitad
+        progress_bar.empty()
 
-        except Exception as e:
-            st.warning(f"No se pudo procesar el archivo '{file_name}'. Error: {e}")
-            continue
-    
-    progress_bar.empty()
-    return all_chunks
+def _get_collection() -> Collection:
+    """Obtiene (o crea) la colección de CVs usando el cliente centralizado."""
+    return get_chroma_client().get_or_create_collection(
+        name=CHROMA_COLLECTION_NAME,
+        metadata=CHROMA_COLLECTION_METADATA,
+        embedding_function=None  # Los embeddings se calculan fuera de Chroma
+    )
+
+def _add_chunks_to_db(
+    chunks: List[Document], vector_memo: Optional[Dict[str, np.ndarray]] = None
+) -> None:
+    """Crea los embeddings en una sola llamada por lotes y los añade a ChromaDB.
+
+    Los fragmentos que ya hubiera de estos CVs se eliminan antes de insertar,
+    de modo que volver a cargar un CV (aunque haya cambiado) sustituye su
+    versión anterior en lugar de mezclarse con ella.
+
+    Los fragmentos con texto idéntico se calculan una sola vez y su vector se
+    reutiliza. `vector_memo` (texto -> vector) se comparte entre llamadas de una
+    misma carga para que el texto repetido entre CVs (encabezados o listas de
+    plantillas) tampoco se recalcule; se actualiza con los vectores nuevos.
+    """
+    embeddings = load_cached_embedding_model()
 
-def _add_chunks_to_db(chunks: List[Document]) -> None:
-    """Crea los embeddings y añade los documentos a ChromaDB usando el cliente centralizado."""
-    embeddings = load_embedding_model()
+    vector_memo = {} if vector_memo is None else vector_memo
+
+    texts: List[str] = [chunk.page_content for chunk in chunks]
+    # Textos distintos aún sin vector, en orden de aparición
+    missing_texts: List[str] = [text for text in dict.fromkeys(texts) if text not in vector_memo]
+    if missing_texts:
+        missing_vectors = np.asarray(embeddings.embed_documents(missing_texts), dtype=np.float32)
+        vector_memo.update(zip(missing_texts, missing_vectors))
+    # Matriz float32 contigua: Chroma la indexa sin convertir listas de floats de Python
+    vectors: np.ndarray = np.stack([vector_memo[text] for text in texts])
+    ids: List[str] = _chunk_ids(chunks)
+    metadatas: List[Dict[str, Any]] = [chunk.metadata for chunk in chunks]
+
+    # Inserción por lotes moderados, sin superar el límite de registros por `add` de Chroma
     client = get_chroma_client()
-    
-    vector_store = Chroma(
-        client=client,
-        collection_name=CHROMA_COLLECTION_NAME,
-        embedding_function=embeddings,
+    batch_size = min(INGEST_BATCH_SIZE, client.get_max_batch_size())
+    batches: List[Dict[str, Any]] = [
+        {
+            "ids": ids[start:start + batch_size],
+            "documents": texts[start:start + batch_size],
+            "metadatas": metadatas[start:start + batch_size],
+            "embeddings": vectors[start:start + batch_size],
+        }
+        for start in range(0, len(chunks), batch_size)
+    ]
+    sources = sorted({meta['source'] for meta in metadatas})
+    where = {'source': sources[0]} if len(sources) == 1 else {'source': {'$in': sources}}
+
+    if CHROMA_SERVER_HOST:
+        # Contra un servidor, cada lote es una petición de red: se solapan varias
+        loop, async_client = _get_async_chroma_client()
+        asyncio.run_coroutine_threadsafe(
+            _upsert_batches_async(async_client, where, batches), loop
+        ).result()
+    else:
+        collection = _get_collection()
+        collection.delete(where=where)
+        for batch in batches:
+            collection.upsert(**batch)
+
+    source_counts = _load_source_counts()
+    # Se asigna (no se suma): los fragmentos anteriores de estos CVs se acaban de borrar
+    source_counts.update(Counter(meta['source'] for meta in metadatas))
+    _write_manifest(SOURCES_MANIFEST_PATH, source_counts)
+
+async def _upsert_batches_async(
+    client: AsyncClientAPI, where: Dict[str, Any], batches: List[Dict[str, Any]]
+) -> None:
+    """Borra los fragmentos previos de los CVs y envía los lotes al servidor de Chroma.
+
+    Los lotes se envían con varias peticiones en curso a la vez.
+    """
+    collection = await client.get_or_create_collection(
+        name=CHROMA_COLLECTION_NAME,
+        metadata=CHROMA_COLLECTION_METADATA,
+        embedding_function=None
     )
-    vector_store.add_documents(documents=chunks)
+    await collection.delete(where=where)
+    semaphore = asyncio.Semaphore(CHROMA_MAX_CONCURRENT_BATCHES)
+
+    async def upsert(batch: Dict[str, Any]) -> None:
+        async with semaphore:
+            await collection.upsert(**batch)
+
+    await asyncio.gather(*(upsert(batch) for batch in batches))
+
+def _chunk_ids(chunks: List[Document]) -> List[str]:
+    """Genera IDs deterministas a partir del archivo, la página y el texto de cada fragmento.
+
+    Un mismo fragmento recibe siempre el mismo ID, de modo que insertarlo dos
+    veces no crea un duplicado. Los fragmentos de una versión anterior del CV
+    no se reemplazan por ID (su texto cambia): `_add_chunks_to_db` los borra
+    antes de insertar. Los textos repetidos en una misma página se distinguen
+    por su orden de aparición.
+    """
+    ids: List[str] = []
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        key = f"{chunk.metadata['source']}:{chunk.metadata['page_number']}:{chunk.page_content}"
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(digest if occurrence == 0 else f"{digest}-{occurrence}")
+    return ids
+
+def _read_manifest(path: Path) -> Optional[Any]:
+    """Lee un fichero auxiliar JSON de la base de datos, o None si no existe."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _load_source_counts() -> Dict[str, int]:
+    """Devuelve el número de fragmentos indexados por CV.
+
+    Se lee del fichero de fuentes. Si no existe o tiene el formato antiguo (una
+    lista de nombres sin recuentos), se reconstruye una vez desde los
+    metadatos de la colección y se guarda.
+    """
+    source_counts = _read_manifest(SOURCES_MANIFEST_PATH)
+    if isinstance(source_counts, dict):
+        return source_counts
+
+    metadatas: List[Dict[str, Any]] = _get_collection().get(include=["metadatas"])['metadatas']
+    source_counts = dict(Counter(
+        ntpath.basename(meta['source']) for meta in metadatas if 'source' in meta
+    ))
+    _write_manifest(SOURCES_MANIFEST_PATH, source_counts)
+    return source_counts
+
+def _read_file_hashes() -> Dict[str, str]:
+    """Devuelve el hash del contenido del PDF indexado para cada CV.
+
+    Al guardarse por nombre de archivo, una versión modificada de un CV
+    sustituye el hash de la anterior. El formato antiguo (una lista de hashes
+    sin nombre) se descarta: esos archivos simplemente se vuelven a procesar.
+    """
+    hash_by_source = _read_manifest(FILE_HASHES_MANIFEST_PATH)
+    return hash_by_source if isinstance(hash_by_source, dict) else {}
+
+def _write_manifest(path: Path, data: Any) -> None:
+    """Guarda un fichero auxiliar JSON junto a la base de datos.
+
+    Se escribe en un fichero temporal del mismo directorio y se sustituye el
+    original con `os.replace` (atómico): otra sesión que lo lea a la vez ve la
+    versión anterior o la nueva, nunca un JSON a medio escribir.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+def _bump_db_version() -> None:
+    """Asigna una versión nueva a la DB tras modificarla.
+
+    Se usa la marca de tiempo en nanosegundos en lugar de un contador: así la
+    versión no se repite aunque el reinicio de Chroma borre el fichero.
+    """
+    _write_manifest(DB_VERSION_PATH, time.time_ns())
 
 def _clear_streamlit_caches() -> None:
-    """Limpia las cachés de Streamlit para forzar la recarga de recursos y datos."""
+    """Limpia la caché de recursos de Streamlit para forzar su recarga.
+
+    Las cachés de datos no se vacían en bloque: `get_db_stats` se invalida de
+    forma explícita y las respuestas cacheadas del LLM usan `get_db_version()`
+    como parte de su clave.
+    """
     st.cache_resource.clear()
-    st.cache_data.clear()